@@ -1,213 +1,195 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 """ Brainfuck to C translator """
-from sys import argv, exit as sysexit
+from sys import argv, exit as sysexit, intern
 from os.path import isfile
+from functools import lru_cache
 
 BF_SYNTAX = {'+', '-', '[', ']', '.', ',', '<', '>'}
 C_HEAD = "#include <stdio.h>\n" +\
-    "char array[0xffff];" +\
+    "static unsigned char array[65536];" +\
     "int main(){" +\
-    "char *ptr = array;" +\
+    "unsigned char *ptr = array;" +\
     "setvbuf(stdout, NULL, _IONBF, 0);" +\
     "int c;\n"
 C_TAIL = "\nputchar('\\n');\nreturn *ptr;}"
+BF_STRIP_DELETE = bytes(i for i in range(256) if chr(i) not in BF_SYNTAX)
+BF_OPPOSITES = {'+': '-', '-': '+', '<': '>', '>': '<'}
+BF_PARSE_TABLE = {char: intern(fragment) for char, fragment in {
+    '+': '++*ptr;', '-': '--*ptr;',
+    '[': '\nwhile (*ptr) {', ']': '}\n',
+    '<': '--ptr;', '>': '++ptr;',
+    '.': 'putchar(*ptr);',
+    ',': 'c=getchar();\nif (c >= 0) *ptr=c;'}.items()}
+BF_OPTI_TABLE = BF_PARSE_TABLE | {'z': '*ptr=0;',
+                                  'm': 'ptr[1]+=*ptr;*ptr=0;'}
+BF_REPEAT_TABLE = {'+': '*ptr+={};', '-': '*ptr-={};',
+                   '<': 'ptr-={};', '>': 'ptr+={};',
+                   'm': 'ptr[{}]+=*ptr;*ptr=0;'}
+BFO_TOKENS = {'+': 'a', '-': 's', '[': '{', ']': '}',
+              '<': 'ml', '>': 'mr', '.': 'ptch', ',': 'gtch',
+              'z': 'z', 'm': 'mv'}
+BFO_INSTRUCT_TABLE = {char: intern(token + ';')
+                      for char, token in BFO_TOKENS.items()}
 
 
-def bf_strip(program: str) -> str:
+def bf_load(filename: str) -> bytes:
+    """ Read program file as bytes """
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def bf_strip(program: bytes | str) -> str:
     """ return only bf chars """
-    return "".join(str(i) for i in program if
-                   i in BF_SYNTAX)
+    if isinstance(program, str):
+        program = program.encode('ascii', 'ignore')
+    return program.translate(None, BF_STRIP_DELETE).decode('ascii')
 
 
 def bf_parse(program: str) -> str:
     """ Parsing program stripped text into C language """
-    res: str = C_HEAD
+    parts: list[str] = [C_HEAD]
     for command in program:
-        if command not in BF_SYNTAX:
-            continue
-        match command:
-            case "+":
-                res += '++*ptr;'
-            case "-":
-                res += '--*ptr;'
-            case "[":
-                res += '\nwhile (*ptr) {'
-            case "]":
-                res += '}\n'
-            case "<":
-                res += '--ptr;'
-            case ">":
-                res += '++ptr;'
-            case ".":
-                res += 'putchar(*ptr);'
-            case ",":
-                res += 'c=getchar();\nif (c >= 0) *ptr=c;'
-            case _:
-                print(f"Unrecognazed pattern '{command}' at bf_parse() !")
-                sysexit(-1)
-    res += C_TAIL
-    return res
+        fragment: str | None = BF_PARSE_TABLE.get(command)
+        if fragment is None:
+            print(f"Unrecognazed pattern '{command}' at bf_parse() !")
+            sysexit(-1)
+        parts.append(fragment)
+    parts.append(C_TAIL)
+    return "".join(parts)
+
 
+def bf_frontend(program: bytes | str) -> list[tuple[str, int]]:
+    """ Strip program, then minimize and run-length encode it
+        in one tokenizing pass """
+    return _bf_tokenize(bf_strip(program))
 
-def bf_minimize(unminimized: str) -> str:
-    """ Minimizing brainfuck program
-        by deleting meaningless instructs """
-    res: str = unminimized
-    max_iters: int = len(res)
-    bad_patterns: set[str] = {"<>", "><", '+-', '-+'}
-    while any(i in res for i in bad_patterns) and max_iters > 0:
-        max_iters -= 1
-        for pattern in bad_patterns:
-            if pattern not in res:
-                continue
-            res = res.replace(pattern, '')
-    program_start: int = 0
-    if res.startswith('['):  # ] first [] in the program will be skipped
-        open_braces_count: int = 0
-        for idx, char in enumerate(res):
+
+def _bf_tokenize(stripped: str) -> list[tuple[str, int]]:
+    tokens: list[tuple[str, int]] = []
+    skip_depth: int = 0
+    for char in stripped:
+        if skip_depth > 0:  # cells are zero, so leading [] are skipped
             if char == '[':  # ]
-                open_braces_count += 1
+                skip_depth += 1
             elif char == ']':
-                open_braces_count -= 1
-            elif open_braces_count <= 0:
-                break
-            if open_braces_count <= 0:
-                program_start = min(idx + 1, len(res) - 1)
-    res = _bf_braces_cleaner(res[program_start:])
-    return res
+                skip_depth -= 1
+        elif char == '[' and not tokens:  # ]
+            skip_depth = 1
+        elif char == ']' and tokens and tokens[-1][0] == '[':
+            tokens.pop()  # empty loop, drop both braces
+        elif char in BF_OPPOSITES and tokens and tokens[-1][0] == char:
+            tokens[-1] = (char, tokens[-1][1] + 1)
+        elif char in BF_OPPOSITES and tokens\
+                and tokens[-1][0] == BF_OPPOSITES[char]:
+            last, count = tokens.pop()
+            if count > 1:
+                tokens.append((last, count - 1))
+        else:
+            tokens.append((char, 1))
+    return tokens
 
 
-def _bf_braces_cleaner(unsolved: str) -> str:
-    current: str = unsolved
-    first_brace: int = -1
-    pointer: int = 0
-    f_changed: bool = False
-    f_stop = False
-
-    while not f_stop:
-        found: str = current[pointer]
-        if found == '[':  # ]
-            first_brace = pointer
-        elif found == ']' and first_brace >= 0:
-            current = current[:first_brace] + current[pointer + 1:]
-            first_brace = -1
-            f_changed = True
-
-        if first_brace >= 0 and pointer - first_brace >= 1:
-            first_brace = -1
-
-        pointer += 1
-
-        if pointer >= len(current):
-            pointer = 0
-            f_stop = not f_changed
-            f_changed = False
-    return current
-
-
-def bf_optimize(unoptimized: str) -> str:
-    """ Optimize bf code to intermidate bfo before C """
-    res: str = ''
-    if len(unoptimized) == 0:
-        return ''
-    char: str = unoptimized[0]
-    count: int = 1
-    for symbol in unoptimized[1:]:
-        if char != symbol or char in {'[', ']', '.', ','}:
-            res += _opti_instruct(char, count)
-            char = symbol
-            count = 1
-        else:
-            count += 1
-    if char != '':
-        res += _opti_instruct(char, count)
-    return res
+try:  # use compiled bf_tokenize.pyx if Cython is available
+    import pyximport
+    PYX_IMPORTERS = pyximport.install(language_level=3)
+    try:
+        from bf_tokenize import bf_tokenize as _bf_tokenize  # noqa: F811
+    finally:
+        pyximport.uninstall(*PYX_IMPORTERS)
+except ImportError:
+    pass
+
+
+def bf_tokens_code(tokens: list[tuple[str, int]]) -> str:
+    """ Return bf program text of the tokens """
+    return "".join([char * count for char, count in tokens])
+
+
+def bf_tokens_bfo(tokens: list[tuple[str, int]]) -> str:
+    """ Return intermidate bfo text of the tokens """
+    return "".join([_opti_instruct(char, count) for char, count in tokens])
 
 
+@lru_cache(maxsize=4096)
 def _opti_instruct(instruct: str, repeat: int) -> str:
-    full_separator: str = ';'
-    num_separator: str = '='
-    res: str = ''
-    match instruct:
-        case "+":
-            res = 'a'
-            res += full_separator if repeat <= 1\
-                else num_separator + str(repeat) + full_separator
-        case "-":
-            res = 's'
-            res += full_separator if repeat <= 1\
-                else num_separator + str(repeat) + full_separator
-        case "[":
-            res = '{' + full_separator
-        case "]":
-            res = '}' + full_separator
-        case "<":
-            res = 'ml'
-            res += full_separator if repeat <= 1\
-                else num_separator + str(repeat) + full_separator
-        case ">":
-            res = 'mr'
-            res += full_separator if repeat <= 1\
-                else num_separator + str(repeat) + full_separator
-        case ".":
-            res = 'ptch' + full_separator
-        case ",":
-            res = 'gtch' + full_separator
-        case _:
-            print(f"Unrecognazed pattern '{instruct}' at _opti_instruct() !")
-            sysexit(-1)
+    res: str | None = BFO_INSTRUCT_TABLE.get(instruct)
+    if res is None:
+        print(f"Unrecognazed pattern '{instruct}' at _opti_instruct() !")
+        sysexit(-1)
+    if repeat != 1 and instruct in BF_REPEAT_TABLE:
+        return f'{BFO_TOKENS[instruct]}={repeat};'
     return res
 
 
-def bf_optiparse(optimized: str) -> str:
-    """ Parse optimized program """
-    res: str = C_HEAD
-    program: list[str] = optimized.split(';')
-    for command in program:
-        if command == '':
+def bf_peephole(tokens: list[tuple[str, int]]) -> list[tuple[str, int]]:
+    """ Replace clear loops with 'z' and move loops with 'm' tokens """
+    res: list[tuple[str, int]] = []
+    for token in tokens:
+        res.append(token)
+        if token[0] != ']':
             continue
-        num_split: str = command.split('=')
-        token: str = num_split[0] if len(num_split) > 0 else ''
-        repeat: str = num_split[1] if len(num_split) == 2 else '1'
-        match token:
-            case "a":
-                if repeat == '1':
-                    res += '++*ptr;'
-                else:
-                    res += f'*ptr+={repeat};'
-            case "s":
-                if repeat == '1':
-                    res += '--*ptr;'
-                else:
-                    res += f'*ptr-={repeat};'
-            case "{":
-                res += '\nwhile (*ptr) {'
-            case "}":
-                res += '}\n'
-            case "ml":
-                if repeat == '1':
-                    res += '--ptr;'
-                else:
-                    res += f'ptr-={repeat};'
-            case "mr":
-                if repeat == '1':
-                    res += '++ptr;'
-                else:
-                    res += f'ptr+={repeat};'
-            case "ptch":
-                res += 'putchar(*ptr);'
-            case "gtch":
-                res += 'c=getchar();\nif (c >= 0) *ptr=c;'
-            case '':
-                print("Got '' from program! Command:", command)
-            case _:
-                print(f"Unrecognazed pattern '{token}' at bf_optiparse() !")
-                sysexit(-1)
-    res += C_TAIL
+        if len(res) >= 3 and res[-3][0] == '[' and _bf_is_clear(res[-2]):
+            res[-3:] = [('z', 1)]
+        elif len(res) >= 6 and res[-6][0] == '[':
+            offset: int = _bf_move_offset(res[-5:-1])
+            if offset != 0:
+                res[-6:] = [('m', offset)]
     return res
 
 
+def _bf_is_clear(token: tuple[str, int]) -> bool:
+    """ Loop body that always reaches 0 for wrapping unsigned char """
+    char, count = token
+    return char in {'+', '-'} and count % 2 == 1
+
+
+def _bf_step(token: tuple[str, int]) -> int:
+    char, count = token
+    if char == '>':
+        return count
+    if char == '<':
+        return -count
+    return 0
+
+
+def _bf_move_offset(body: list[tuple[str, int]]) -> int:
+    """ Offset of the target cell if body is '->+<' or '>+<-' alike """
+    if body[0] == ('-', 1):
+        body = body[1:]
+    elif body[-1] == ('-', 1):
+        body = body[:-1]
+    else:
+        return 0
+    if len(body) != 3 or body[1] != ('+', 1):
+        return 0
+    offset: int = _bf_step(body[0])
+    if offset == 0 or _bf_step(body[2]) != -offset:
+        return 0
+    return offset
+
+
+def bf_optiparse(tokens: list[tuple[str, int]]) -> str:
+    """ Parse optimized program tokens into C language """
+    parts: list[str] = [C_HEAD]
+    for char, count in tokens:
+        if count != 1 and char in BF_REPEAT_TABLE:
+            parts.append(_opti_fragment(char, count))
+            continue
+        fragment: str | None = BF_OPTI_TABLE.get(char)
+        if fragment is None:
+            print(f"Unrecognazed pattern '{char}' at bf_optiparse() !")
+            sysexit(-1)
+        parts.append(fragment)
+    parts.append(C_TAIL)
+    return "".join(parts)
+
+
+@lru_cache(maxsize=4096)
+def _opti_fragment(char: str, count: int) -> str:
+    return BF_REPEAT_TABLE[char].format(count)
+
+
 def _print_help():
     print("Brainfuck to C translator V0.9")
     print("Usage:\tbf2c [options] <file>")
@@ -248,31 +230,27 @@ if __name__ == "__main__":
     SAVENAME = SAVENAME.replace('.bf', '.c')\
         if SAVENAME.endswith('.bf') else SAVENAME.replace('.b', '.c')
 
-    BFPROGRAM = ''
-    with open(FILENAME, 'r', encoding='utf-8') as f:
-        BFPROGRAM = f.read()
+    BFTOKENS = bf_frontend(bf_load(FILENAME))
     print(f"Program {FILENAME} loaded.")
     print("Parsing...")
-    BFPROGRAM = bf_strip(BFPROGRAM)
-    BFPROGRAM = bf_minimize(BFPROGRAM)
     if IS_OPTIMIZE:
-        BFOPROGRAM: str = bf_optimize(BFPROGRAM)
-        CPROGRAM = bf_optiparse(BFOPROGRAM)
+        BFOTOKENS = bf_peephole(BFTOKENS)
+        CPROGRAM = bf_optiparse(BFOTOKENS)
     else:
-        CPROGRAM = bf_parse(BFPROGRAM)
+        CPROGRAM = bf_parse(bf_tokens_code(BFTOKENS))
     print("Parsing done")
 
     if IS_KEEP_CODE:
         SAVENAME_MIN_BF = FILENAME.replace(".b", '_mini.b')
         print(f"Saving minimized code as {SAVENAME_MIN_BF}")
         with open(SAVENAME_MIN_BF, 'w+', encoding='utf-8') as f:
-            f.write(BFPROGRAM)
+            f.write(bf_tokens_code(BFTOKENS))
 
     if IS_KEEP_OPTI:
         SAVENAME_OPTI = FILENAME + 'o'
         print(f"Saving optimized code as {SAVENAME_OPTI}")
         with open(SAVENAME_OPTI, 'w+', encoding='utf-8') as f:
-            f.write(BFOPROGRAM)
+            f.write(bf_tokens_bfo(BFOTOKENS))
 
     print(f"Saving as {SAVENAME}")
     with open(SAVENAME, 'w+', encoding='utf-8') as f:
@@ -0,0 +1,53 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+""" Compiled version of bf2c._bf_tokenize """
+
+
+cdef inline Py_UCS4 _opposite(Py_UCS4 char):
+    if char == '+':
+        return '-'
+    if char == '-':
+        return '+'
+    if char == '<':
+        return '>'
+    if char == '>':
+        return '<'
+    return 0
+
+
+cpdef list bf_tokenize(str stripped):
+    """ Minimize and run-length encode stripped bf code """
+    cdef list tokens = []
+    cdef tuple top
+    cdef Py_UCS4 char
+    cdef Py_UCS4 last = 0  # last run is kept out of tokens until it ends
+    cdef Py_ssize_t count = 0
+    cdef Py_ssize_t skip_depth = 0
+    for char in stripped:
+        if skip_depth > 0:  # cells are zero, so leading [] are skipped
+            if char == '[':  # ]
+                skip_depth += 1
+            elif char == ']':
+                skip_depth -= 1
+        elif char == '[' and last == 0:  # ]
+            skip_depth = 1
+        elif (char == ']' and last == '[') or \
+                (last != 0 and _opposite(char) == last and count == 1):
+            if tokens:  # empty loop or cancelled run, reopen previous one
+                top = tokens.pop()
+                last = top[0]
+                count = top[1]
+            else:
+                last = 0
+                count = 0
+        elif char == last and _opposite(char) != 0:
+            count += 1
+        elif last != 0 and _opposite(char) == last:
+            count -= 1
+        else:
+            if last != 0:
+                tokens.append((last, count))
+            last = char
+            count = 1
+    if last != 0:
+        tokens.append((last, count))
+    return tokens
@@ -2,27 +2,89 @@
 # --- encoding UTF-8 ---
 """ A simple interpretator of the esoteric language Brainfuck """
 
-from sys import argv, exit as sysexit, stdin
+from sys import argv, exit as sysexit, stdin, stdout, maxsize
 from os.path import exists, abspath, isfile
 from time import time
 from getch import getche
+try:  # JIT compiled run_bf if numba is installed
+    from numba import njit
+    import numpy as np
+except ImportError:
+    njit = None
 
 REG_SIZE_MAX = 30_000
 CHAR_SIZE_MAX = 256
+OUTBUF_MAX = 4096
+PIPE_CHUNK = 64 * 1024
+
+OP_ADD, OP_SUB, OP_LEFT, OP_RIGHT, OP_OUT, OP_IN, OP_OPEN, OP_CLOSE, \
+    OP_ZERO = range(9)
+BF_OPCODES = {ord(char): opcode for char, opcode in {
+    '+': OP_ADD, '-': OP_SUB, '<': OP_LEFT, '>': OP_RIGHT,
+    '.': OP_OUT, ',': OP_IN, '[': OP_OPEN, ']': OP_CLOSE}.items()}
+BF_STRIP_DELETE = bytes(i for i in range(256) if i not in BF_OPCODES)
+FUSED_OPS = {OP_ADD, OP_SUB, OP_LEFT, OP_RIGHT}
+RUN_BF_SLICE = 1_000_000  # backward jumps per jitted run_bf call
+
+
+def run_bf(opcodes, args, reg, ptr: int, pos: int,
+           budget: int) -> tuple[int, int]:
+    """ Run compiled program from 'pos' until it ends, reaches I/O
+        or takes 'budget' backward jumps
+        Return pointer and position where it stopped """
+    size: int = len(reg)
+    ops_len: int = len(opcodes)
+    while pos < ops_len:
+        opcode = opcodes[pos]
+        arg = args[pos]
+        if opcode == OP_ADD:
+            num = reg[ptr] + arg
+            reg[ptr] = num if num < CHAR_SIZE_MAX else CHAR_SIZE_MAX - 1
+        elif opcode == OP_SUB:
+            num = reg[ptr] - arg
+            reg[ptr] = num if num > 0 else 0
+        elif opcode == OP_RIGHT:
+            ptr += arg
+            if ptr >= size:
+                ptr %= size
+        elif opcode == OP_LEFT:
+            ptr -= arg
+            if ptr < 0:
+                ptr %= size
+        elif opcode == OP_OPEN:
+            if reg[ptr] == 0:
+                pos = arg
+        elif opcode == OP_CLOSE:
+            if reg[ptr] != 0:
+                pos = arg
+                budget -= 1
+                if budget == 0:
+                    pos += 1
+                    break
+        elif opcode == OP_ZERO:
+            reg[ptr] = 0
+        else:
+            break
+        pos += 1
+    return ptr, pos
+
+
+if njit is not None:
+    run_bf = njit(cache=True)(run_bf)
 
 
 class Register:
     """ Simple register """
 
     def __init__(self) -> None:
-        self.reg = [0 for _ in range(REG_SIZE_MAX)]
+        self.reg = bytearray(REG_SIZE_MAX)
         self.size = len(self.reg)
         self.pointer = 0
+        self._zero_block = bytes(REG_SIZE_MAX)
 
     def reset(self) -> None:
         """ Resetting the register and pointer """
-        self.reg = [0 for _ in range(REG_SIZE_MAX)]
-        self.size = len(self.reg)
+        self.reg[:] = self._zero_block
         self.pointer = 0
 
     def move_left(self, n: int = 1) -> None:
@@ -58,15 +120,17 @@ class Register:
 
     def increment(self, n: int = 1) -> None:
         """ Increments a value in the current cell """
-        self.reg[self.pointer] += n
-        if self.read() >= CHAR_SIZE_MAX:
-            self.reg[self.pointer] = CHAR_SIZE_MAX - 1
+        num: int = self.reg[self.pointer] + n
+        if num >= CHAR_SIZE_MAX:
+            num = CHAR_SIZE_MAX - 1
+        self.reg[self.pointer] = num
 
     def decrement(self, n: int = 1) -> None:
         """ Decrements a value in the current cell """
-        self.reg[self.pointer] -= n
-        if self.read() <= 0:
-            self.reg[self.pointer] = 0
+        num: int = self.reg[self.pointer] - n
+        if num <= 0:
+            num = 0
+        self.reg[self.pointer] = num
 
     def print_reg(self, n: int = 5):
         """ Print register cells in 'n' radius """
@@ -91,6 +155,11 @@ class BFInterpreter:
         self.step: bool = isstep
         self.use_outinput: bool = use_outinput
         self.outinput: bytes = b''
+        self.outinput_pos: int = 0
+        self.outbuf: bytearray = bytearray()
+        self.piped: bool = not stdin.isatty()
+        self.pipebuf: bytes = b''
+        self.pipe_pos: int = 0
         if self.use_outinput:
             print("[INT] Using preinput. To finish input, press CTRL+D")
             self.outinput = stdin.buffer.read()
@@ -106,66 +175,89 @@ class BFInterpreter:
         if use_outinput is not None and use_outinput:
             print("[INT] Using preinput. To finish input, press CTRL+D")
             self.outinput = stdin.buffer.read()
+            self.outinput_pos = 0
             print(flush=True)
 
-    def parse(self, text: str, lookup="+-,.<>[]") -> str:
+    def parse(self, text: bytes) -> bytes:
         """ Parse brainfuck program, removing all unessesery chars """
-        return ''.join(c for c in text if c in lookup)
-
-    def map_braces(self, program_text: str) -> None:
-        """ Find map pairs in program text """
-        raw_lbrace: list[int] = []
-        raw_rbrace: list[int] = []
-        pos: int = 0
-        for char in program_text:
-            if char == '[':
-                raw_lbrace.insert(0, pos)
-            elif char == ']':
-                raw_rbrace.append(pos)
-            pos += 1
-        if len(raw_lbrace) != len(raw_rbrace):
+        return text.translate(None, BF_STRIP_DELETE)
+
+    def map_braces(self, program_text: bytes) -> dict[int, int]:
+        """ Find map pairs in program text, both '[' -> ']' and ']' -> '[' """
+        open_braces: list[int] = []
+        brace_map: dict[int, int] = {}
+        for pos, opcode in enumerate(map(BF_OPCODES.get, program_text)):
+            if opcode == OP_OPEN:
+                open_braces.append(pos)
+            elif opcode == OP_CLOSE:
+                if not open_braces:
+                    print("\n[ERR] Syntax error: braces mismatch.")
+                    sysexit(5)
+                first: int = open_braces.pop()
+                brace_map[first] = pos
+                brace_map[pos] = first
+        if open_braces:
             print("\n[ERR] Syntax error: braces mismatch.")
             sysexit(5)
-        return self._find_brace_pair(raw_lbrace, raw_rbrace, program_text)
-
-    def _find_brace_pair(self, raw_lbrace: list[int], raw_rbrace: list[int],
-                         program_text: str) -> dict[int: int]:
-        brace_map: dict[int: int] = {}
-        if len(raw_lbrace) == 0:
-            return brace_map
-        while len(raw_lbrace) > 0:
-            complexity: int = 0
-            first: int = raw_lbrace[-1]
-            last: int = raw_rbrace[-1]
-            for i in range(first, last+1):
-                char: str = program_text[i]
-                if char == "[":
-                    complexity += 1
-                if char != "]":
-                    continue
-                complexity -= 1
-                if complexity <= 0:
-                    map_key = raw_lbrace.pop()
-                    map_value = raw_rbrace.pop(raw_rbrace.index(i))
-                    program_text = str(program_text[:map_key] + 'x'
-                                       + program_text[map_key+1:map_value]+'x'
-                                       + program_text[map_value+1:])
-                    brace_map[map_key] = map_value
-                    break
         return brace_map
 
-    def get_map_key(self, mymap: dict[int: int], map_value: int) -> int:
-        """ Get key by value from braces pair map """
-        keyval_id = 0
-        for val in mymap.values():
-            if val == map_value:
-                break
-            keyval_id += 1
+    def put_char(self) -> None:
+        """ Output the value of the current cell """
+        self.outbuf.append(self.register.read())
+        if self.step or len(self.outbuf) >= OUTBUF_MAX:
+            self.flush_output()
+        if self.step:
+            print(" <- output")
+
+    def flush_output(self) -> None:
+        """ Write buffered output of the program to stdout """
+        if not self.outbuf:
+            return
+        stdout.flush()
+        stdout.buffer.write(self.outbuf)
+        stdout.flush()
+        self.outbuf.clear()
+
+    def read_pipe(self) -> str:
+        """ Read one char from piped stdin, '' on end of input """
+        if self.pipe_pos >= len(self.pipebuf):
+            self.pipebuf = stdin.buffer.read1(PIPE_CHUNK)
+            self.pipe_pos = 0
+            if not self.pipebuf:
+                return ''
+        uin = chr(self.pipebuf[self.pipe_pos])
+        self.pipe_pos += 1
+        return uin
+
+    def get_char(self, no_input: bool = False) -> bool:
+        """ Read one char of input into the current cell
+            Return False if input was interrupted, True otherwise """
+        self.flush_output()
+        if self.step:
+            print("> ", end='', flush=True)
+        if self.use_outinput and self.outinput_pos < len(self.outinput):
+            uin = chr(self.outinput[self.outinput_pos])
+            self.outinput_pos += 1
+        elif no_input or self.use_outinput:
+            uin = '\x00'
+        elif self.piped:
+            uin = self.read_pipe()
         else:
-            raise KeyError("Value not found in dict.")
-        return list(mymap.keys())[keyval_id]
+            uin = str(getche())
+        if uin in {'', '\x00'}:
+            if uin == '':
+                uin = '\x00'
+            print(flush=True)
+        elif uin == '\x04':
+            print("\n[INF] Input interupting symbol. Aborting.")
+            return False
+        self.register.write(uin)
+        if self.step:
+            print(" <- input" if not self.use_outinput
+                  else f"{uin} <- input")
+        return True
 
-    def interprete(self, word: str, brace_map: dict[int: int],
+    def interprete(self, word: str, brace_map: dict[int, int],
                    no_input: bool = False) -> bool:
         """ Interpretes Brainfuck commands """
         if 0 <= len(word) > 1:
@@ -181,42 +273,72 @@ class BFInterpreter:
             case ">":
                 self.register.move_right()
             case ".":
-                uout = self.register.read()
-                print(chr(uout), end='', flush=True)
-                if self.step:
-                    print(" <- output")
+                self.put_char()
             case ",":
-                if self.step:
-                    print("> ", end='', flush=True)
-                if self.use_outinput and len(self.outinput) > 0:
-                    uin = chr(self.outinput[0])
-                    self.outinput = self.outinput[1:]\
-                        if len(self.outinput) > 1 else b''
-                elif no_input or (self.use_outinput and
-                                  len(self.outinput) < 1):
-                    uin = '\x00'
-                else:
-                    uin = str(getche())
-                if uin in {'', '\x00'}:
-                    if uin == '':
-                        uin = '\x00'
-                    print(flush=True)
-                elif uin == '\x04':
-                    print("\n[INF] Input interupting symbol. Aborting.")
+                if not self.get_char(no_input):
                     return False
-                self.register.write(uin)
-                if self.step:
-                    print(" <- input" if not self.use_outinput
-                          else f"{uin} <- input")
             case "[":  # ]
                 if self.register.read() == 0:
                     self.text_pos = brace_map[self.text_pos]
             case "]":
                 if self.register.read() != 0:
-                    back_pos = self.get_map_key(brace_map, self.text_pos)
-                    self.text_pos = back_pos
+                    self.text_pos = brace_map[self.text_pos]
         return True
 
+    def compile(self, program_text: bytes) -> list[tuple[int, int]]:
+        """ Compile parsed program into list of (opcode, arg) pairs
+            Runs of '+-<>' are fused, '[-]' becomes OP_ZERO and
+            brace args are op indexes of the pair """
+        ops: list[tuple[int, int]] = []
+        open_ops: list[int] = []
+        for char in program_text:
+            opcode: int = BF_OPCODES[char]
+            if opcode in FUSED_OPS and ops and ops[-1][0] == opcode:
+                ops[-1] = (opcode, ops[-1][1] + 1)
+            elif opcode == OP_OPEN:
+                open_ops.append(len(ops))
+                ops.append((OP_OPEN, 0))
+            elif opcode == OP_CLOSE:
+                first: int = open_ops.pop()
+                if len(ops) == first + 2 and ops[-1] == (OP_SUB, 1):
+                    del ops[first:]
+                    ops.append((OP_ZERO, 0))
+                else:
+                    ops[first] = (OP_OPEN, len(ops))
+                    ops.append((OP_CLOSE, first))
+            else:
+                ops.append((opcode, 1))
+        return ops
+
+    def execute(self, ops: list[tuple[int, int]],
+                no_input: bool = False) -> None:
+        """ Run compiled program, I/O is done here between run_bf calls """
+        opcodes = [opcode for opcode, _ in ops]
+        args = [arg for _, arg in ops]
+        reg = self.register.reg
+        budget: int = maxsize  # plain python is interrupted by CTRL+C anyway
+        if njit is not None:
+            budget = RUN_BF_SLICE
+            opcodes = np.array(opcodes, dtype=np.int32)
+            args = np.array(args, dtype=np.int32)
+            reg = np.frombuffer(reg, dtype=np.uint8)
+        ptr: int = self.register.pointer
+        pos: int = 0
+        while True:  # with numba CTRL+C is delivered between run_bf slices
+            ptr, pos = run_bf(opcodes, args, reg, ptr, pos, budget)
+            self.register.pointer = ptr
+            if pos >= len(opcodes):
+                break
+            if opcodes[pos] == OP_OUT:
+                self.put_char()
+            elif opcodes[pos] == OP_IN:
+                if not self.get_char(no_input):
+                    break
+            else:
+                continue
+            pos += 1
+        self.register.pointer = ptr
+
 
 class Main:
     """ Main class """
@@ -247,11 +369,11 @@ class Main:
             self.options['preinput'] = True
 
         self.filename: str = args[-1]
-        self.text: str = ''
+        self.text: bytes = b''
         self.text_pos: int = 0
         self.interpreter = BFInterpreter(self.options['step'],
                                          self.options['preinput'])
-        self.brace_map: dict[int: int] = {}
+        self.brace_map: dict[int, int] = {}
 
     def print_help(self):
         """ Prints Help message """
@@ -285,6 +407,11 @@ class Main:
             f.writelines(lines)
         print("[INF] Done. Saved as", dump_name)
 
+    def load_program(self) -> bytes:
+        """ Read program file as bytes """
+        with open(self.filename, 'rb') as file:
+            return file.read()
+
     def run(self, filename: str = None, rerun: bool = False) -> None:
         """ Main function """
         self.interpreter.reset()
@@ -297,10 +424,7 @@ class Main:
         self.text_pos = self.interpreter.text_pos
 
         if not rerun:
-            loaded_program = ''
-            with open(self.filename, 'r', encoding='utf-8') as file:
-                loaded_program = (str(file.read()))
-                self.text = loaded_program
+            self.text = self.load_program()
         filesize = len(self.text)
         print(f"[INF] File '{self.filename}' loaded",
               f"({str(filesize / 1024) + " KB" if filesize > 1024
@@ -318,19 +442,22 @@ class Main:
               else "program")
 
         start_time = time()
-        while self.text_pos < filesize:
-            symbol = self.text[self.text_pos]
-            if isinstance(symbol, str) and symbol != '':
-                if not self.interpreter.interprete(symbol, self.brace_map,
-                                                   self.options["no-input"]):
+        if not self.options["step"]:
+            self.interpreter.execute(self.interpreter.compile(self.text),
+                                     self.options["no-input"])
+        else:
+            while self.text_pos < filesize:
+                symbol = chr(self.text[self.text_pos])
+                if not self.interpreter.interprete(
+                        symbol, self.brace_map, self.options["no-input"]):
                     break
-            self.text_pos = self.interpreter.text_pos
-            self.text_pos += 1
-            self.interpreter.text_pos = self.text_pos
-            if self.options["step"]:
+                self.text_pos = self.interpreter.text_pos
+                self.text_pos += 1
+                self.interpreter.text_pos = self.text_pos
                 self.interpreter.register.print_reg()
                 print("symbol:", symbol, ", text_pos: ", self.text_pos)
                 input()
+        self.interpreter.flush_output()
         elapsed = time() - start_time
         el_mins = elapsed // 60
         el_sec = elapsed % 60
@@ -344,6 +471,7 @@ if __name__ == "__main__":
     try:
         main.run()
     except (EOFError, KeyboardInterrupt):
+        main.interpreter.flush_output()
         print("\n[INF] Execution interupted")
         if main.options['dump']:
             main.dump_reg()